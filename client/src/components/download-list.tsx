@@ -1,4 +1,4 @@
-import { useQuery } from "@tanstack/react-query";
+import { useQuery, useQueryClient } from "@tanstack/react-query";
 import { Progress } from "@/components/ui/progress";
 import { Button } from "@/components/ui/button";
 import { Pause, Play, X, ChevronDown, ChevronUp } from "lucide-react";
@@ -15,11 +15,12 @@ import { Collapsible, CollapsibleContent, CollapsibleTrigger } from "@/component
 * @returns {JSX.Element} React component displaying the download list with controls.
 * @description
 *   - Uses the `useQuery` hook to fetch and manage the state of ongoing downloads.
-*   - Implements Server-Sent Events for real-time updates on download statuses.
+*   - Implements Server-Sent Events for real-time updates on download statuses; changed records are patched into the query cache, other events trigger a refetch.
 *   - Collapsible UI for handling download playlists and their items.
 *   - Provides user interaction buttons to pause, resume, and cancel downloads with specific status restrictions.
 */
 export default function DownloadList() {
+  const queryClient = useQueryClient();
   const { data: downloads = [], refetch } = useQuery({
     queryKey: ["/api/downloads"],
   });
@@ -28,11 +29,20 @@ export default function DownloadList() {
 
   useEffect(() => {
     const source = new EventSource("/api/downloads/events");
-    source.onmessage = () => {
-      refetch();
+    source.onmessage = (event) => {
+      if (event.data === "ping" || event.data === "update") {
+        refetch();
+        return;
+      }
+      const record = JSON.parse(event.data);
+      queryClient.setQueryData(["/api/downloads"], (current: any[] = []) =>
+        current.some(download => download.id === record.id)
+          ? current.map(download => (download.id === record.id ? record : download))
+          : [...current, record]
+      );
     };
     return () => source.close();
-  }, [refetch]);
+  }, [queryClient, refetch]);
 
   const togglePlaylist = (id: string) => {
     setOpenPlaylists(prev => ({
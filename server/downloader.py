@@ -1,19 +1,112 @@
 import os
+import copy
+import time
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logging.handlers import QueueHandler, QueueListener
+import orjson
 import yt_dlp
-from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 import shutil
 
+# Worker processes running yt-dlp (and its ffmpeg postprocessors) at once
+MAX_CONCURRENT_DOWNLOADS = 4
+# Entries of one playlist downloading at once, so a long playlist leaves
+# workers free for other requests
+MAX_CONCURRENT_PLAYLIST_ITEMS = 2
+# Download records kept in memory; the oldest are dropped beyond this
+MAX_TRACKED_DOWNLOADS = 1024
+# Records returned by one GET /downloads
+MAX_LISTED_DOWNLOADS = 100
+# Minimum seconds between two forwarded 'downloading' progress events
+PROGRESS_INTERVAL = 0.1
+# Seconds without an update after which an event stream sends a comment,
+# so proxies (undici's 300 s body timeout) don't drop a quiet stream
+KEEPALIVE_INTERVAL = 15
+# Seconds a pump thread waits for an event before checking whether to stop
+PUMP_POLL_INTERVAL = 0.5
+# Seconds an extracted info dict is reused for the same URL
+INFO_CACHE_TTL = 600
+# Info dicts each worker keeps; one with captions can run to several MB
+MAX_CACHED_INFOS = 8
+# Workers are spawned rather than forked from the threaded server process
+_mp = multiprocessing.get_context("spawn")
+
+# Log records are only enqueued on the calling thread; a single listener
+# thread does the actual writes, so yt-dlp output never waits on stderr.
+# Download workers send theirs through their pool's progress queue instead.
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+logger = logging.getLogger("downloader")
+logger.addHandler(QueueHandler(_log_queue))
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+EXECUTOR: ProcessPoolExecutor | None = None
+# Set to stop the pump thread of the current pool
+_pump_stop: threading.Event | None = None
+# Held by every job handed to EXECUTOR, so it never holds more jobs than it
+# has workers: a pool fails everything it holds when one worker dies
+_worker_slots: asyncio.Semaphore | None = None
+
+def _start_pool():
+    """Start a worker pool together with its own progress queue and pump thread.
+    Processing Logic:
+        - Workers may be terminated or killed by the OS while holding the queue's write lock, so a queue is never reused by a later pool and the server process never writes to it.
+        - The pump runs on a daemon thread, so one blocked on a broken queue cannot hold up shutdown."""
+    global EXECUTOR, _pump_stop
+    progress_queue = _mp.Queue()
+    _pump_stop = threading.Event()
+    threading.Thread(
+        target=_pump_progress,
+        args=(progress_queue, asyncio.get_running_loop(), _pump_stop),
+        daemon=True,
+    ).start()
+    EXECUTOR = ProcessPoolExecutor(
+        max_workers=MAX_CONCURRENT_DOWNLOADS,
+        mp_context=_mp,
+        initializer=_init_worker,
+        initargs=(progress_queue,),
+    )
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global _worker_slots
+    _log_listener.start()
+    _worker_slots = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    _start_pool()
     yield
+    # A running download can take hours; stop the workers instead of waiting
+    # for them, so a restarted server is not racing a lingering old one.
+    for task in list(_jobs):
+        task.cancel()
+    _fail_unfinished("Server shut down before the download finished.")
+    # ProcessPoolExecutor has no public way to stop running workers before
+    # Python 3.14.
+    workers = list(EXECUTOR._processes.values())
+    EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        await asyncio.to_thread(worker.join)
+    _pump_stop.set()
     if os.path.exists("downloads"):
         shutil.rmtree("downloads")
+    _log_listener.stop()
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,12 +122,82 @@ class DownloadRequest(BaseModel):
     quality: str
     is_playlist: bool = False
 
-downloads: dict = {}
+# Insertion-ordered, so the oldest record is evicted first
+downloads: OrderedDict = OrderedDict()
+# Serialized GET /downloads body; reset to None whenever a record changes
+_downloads_json: bytes | None = None
+# (url, format, quality, is_playlist) -> id of the download serving it
+_download_ids: dict = {}
+# asyncio.Tasks waiting on a worker, one per download or playlist entry
+_jobs: set = set()
+# download id -> asyncio.Queues of (serialized record, is_final) for open event streams
+_subscribers: dict = {}
+# ids of downloads that are completed or have failed
+_finished_ids: set = set()
+# ids of playlists whose entries are still being listed
+_listing_ids: set = set()
+# playlist download id -> asyncio.Semaphore bounding its entry downloads
+_playlist_slots: dict = {}
+# (download id, item) of jobs a worker has reported as started
+_started_jobs: set = set()
+
+# Worker-process state. Each worker runs one download at a time, so the
+# shared progress_hook reports to whichever download is active.
+_ydl_cache: dict = {}
+# url -> (monotonic time of extraction, unprocessed info dict)
+_info_cache: OrderedDict = OrderedDict()
+_active_download_id = None
+# Index of the playlist entry being downloaded, or None for a whole download
+_active_item = None
+_progress_queue = None
+_last_progress_at = 0.0
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to YouTube Downloader API", "status": "ok"}
 
+FORMAT_OPTIONS: dict[tuple[str, str], str] = {
+    ("mp4", "high"): "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
+    ("mp4", "medium"): "bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[height<=720][ext=mp4]/best",
+    ("mp4", "low"): "worst[ext=mp4]/worst",
+    ("webm", "high"): "bestvideo[ext=webm]+bestaudio[ext=webm]/best[ext=webm]/best",
+    ("webm", "medium"): "bestvideo[height<=720][ext=webm]+bestaudio[ext=webm]/best[height<=720][ext=webm]/best",
+    ("webm", "low"): "worst[ext=webm]/worst",
+    ("m4a", "high"): "bestaudio[ext=m4a]/best[ext=m4a]/best",
+    ("m4a", "medium"): "bestaudio[abr<=128][ext=m4a]/best[abr<=128][ext=m4a]/best",
+    ("m4a", "low"): "worstaudio[ext=m4a]/worst",
+    ("mp3", "high"): "bestaudio/best",
+    ("mp3", "medium"): "bestaudio[abr<=128]/best",
+    ("mp3", "low"): "worstaudio/worst",
+}
+
+def _video_pp(format: str, quality: str) -> list:
+    # mp4 can hold every codec YouTube serves, so a stream copy is always
+    # enough; webm only accepts VP8/VP9/AV1 + Vorbis/Opus and still needs a
+    # real transcode when the fallback picked H.264/AAC.
+    return [{
+        'key': 'FFmpegVideoRemuxer' if format == 'mp4' else 'FFmpegVideoConvertor',
+        'preferedformat': format,
+    }]
+
+def _audio_pp(format: str, quality: str) -> list:
+    return [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': format,
+        'preferredquality': '192' if quality == 'high' else '128',
+    }]
+
+def _no_pp(format: str, quality: str) -> list:
+    return []
+
+# format -> builder of the yt-dlp postprocessors for that format and quality
+POSTPROC = {
+    'mp4': _video_pp,
+    'webm': _video_pp,
+    'mp3': _audio_pp,
+    'm4a': _audio_pp,
+}
+
 def get_format_string(format: str, quality: str) -> str:
     """Get the appropriate format string for video/audio download based on desired format and quality.
     Parameters:
@@ -43,32 +206,368 @@ def get_format_string(format: str, quality: str) -> str:
     Returns:
         - str: The format string used for downloading the specified format and quality.
     Processing Logic:
-        - Utilizes pre-defined format options to map input parameters to the correct format string.
-        - Supports various formats ensuring appropriate quality strings for download.
-        - Leverages nested dictionaries for efficient retrieval of format options."""
-    format_options = {
-        "mp4": {
-            "high": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
-            "medium": "bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[height<=720][ext=mp4]/best",
-            "low": "worst[ext=mp4]/worst"
-        },
-        "webm": {
-            "high": "bestvideo[ext=webm]+bestaudio[ext=webm]/best[ext=webm]/best",
-            "medium": "bestvideo[height<=720][ext=webm]+bestaudio[ext=webm]/best[height<=720][ext=webm]/best",
-            "low": "worst[ext=webm]/worst"
-        },
-        "m4a": {
-            "high": "bestaudio[ext=m4a]/best[ext=m4a]/best",
-            "medium": "bestaudio[abr<=128][ext=m4a]/best[abr<=128][ext=m4a]/best",
-            "low": "worstaudio[ext=m4a]/worst"
-        },
-        "mp3": {
-            "high": "bestaudio/best",
-            "medium": "bestaudio[abr<=128]/best",
-            "low": "worstaudio/worst"
+        - Looks the pair up in FORMAT_OPTIONS, which is built once at import time."""
+    return FORMAT_OPTIONS[(format, quality)]
+
+def _looks_like_playlist(url: str) -> bool:
+    return 'list=' in url or '/playlist' in url
+
+def update_download(download_id: str, d: dict):
+    """Apply a progress event reported by a download worker to its entry in downloads.
+    Parameters:
+        - download_id (str): The ID of the download the event belongs to.
+        - d (dict): The event; yt-dlp progress hook fields plus a 'status' of 'downloading', 'finished', 'error', 'playlist', 'entry', 'done' or 'failed', and an 'item' index for events about one playlist entry.
+    Processing Logic:
+        - Runs on the event loop only, so the downloads dictionary has a single writer.
+        - Events for a download that has already been evicted are dropped.
+        - The updated record is pushed to every open /downloads/{id}/events stream.
+        - 'playlist' starts the listing of a playlist and 'entry' adds one listed entry as a pending item.
+        - 'done' and 'failed' are sent once a worker has finished with the download or entry; a playlist is finished once it is fully listed and every item has settled."""
+    global _downloads_json
+    if download_id not in downloads:
+        return
+    _downloads_json = None
+    record = downloads[download_id]
+    item = d.get('item')
+    if d['status'] == 'downloading':
+        try:
+            if 'total_bytes' in d:
+                progress = (d['downloaded_bytes'] / d['total_bytes']) * 100
+            elif 'total_bytes_estimate' in d:
+                progress = (d['downloaded_bytes'] / d['total_bytes_estimate']) * 100
+            else:
+                progress = 0
+            title = os.path.basename(d.get('filename', ''))
+
+            if item is None:
+                record['progress'] = progress
+                record['title'] = title
+            else:
+                record['items'][item]['progress'] = progress
+                record['items'][item]['title'] = title
+                record['items'][item]['status'] = 'downloading'
+                record['progress'] = sum(entry['progress'] for entry in record['items']) / len(record['items'])
+            record['status'] = 'downloading'
+        except Exception:
+            logger.exception("Error updating progress")
+
+    # A merged format finishes once per stream, so entries only count as
+    # completed on their 'done' event.
+    elif d['status'] == 'finished' and item is None:
+        record['current_item'] += 1
+        record['status'] = 'completed' if record['current_item'] >= record['total_items'] else 'downloading'
+        record['progress'] = 100 if record['status'] == 'completed' else record['progress']
+    elif d['status'] == 'error':
+        if item is not None:
+            record["items"][item]["status"] = "error"
+            record["items"][item]["error"] = str(d.get('error', 'Unknown error'))
+        record["error"] = str(d.get('error', 'Unknown error'))
+    elif d['status'] == 'playlist':
+        record["title"] = d['title'] or ''
+        _listing_ids.add(download_id)
+        _playlist_slots[download_id] = asyncio.Semaphore(MAX_CONCURRENT_PLAYLIST_ITEMS)
+    elif d['status'] == 'entry':
+        record["total_items"] += 1
+        record["items"].append({
+            "title": d['title'],
+            "status": "pending",
+            "progress": 0,
+            "error": None
+        })
+    elif d['status'] in ('done', 'failed'):
+        if item is not None:
+            if d['status'] == 'done':
+                if record["items"][item]["status"] != "error":
+                    record["items"][item]["status"] = "completed"
+                    record["items"][item]["progress"] = 100
+            else:
+                record["items"][item]["status"] = "error"
+                record["items"][item]["error"] = d['error']
+                record["error"] = d['error']
+            record["current_item"] += 1
+        else:
+            _listing_ids.discard(download_id)
+            if d['status'] == 'failed':
+                record["status"] = "error"
+                record["error"] = d['error']
+        if download_id not in _listing_ids and record["current_item"] >= record["total_items"]:
+            if record["error"] is None:
+                record["status"] = "completed"
+                record["progress"] = 100
+            else:
+                record["status"] = "error"
+            _playlist_slots.pop(download_id, None)
+            _finished_ids.add(download_id)
+
+    _publish(download_id)
+
+def _publish(download_id: str):
+    # Push the record to every open /downloads/{id}/events stream.
+    if download_id in _subscribers:
+        snapshot = (orjson.dumps(downloads[download_id]), download_id in _finished_ids)
+        for subscriber in _subscribers[download_id]:
+            subscriber.put_nowait(snapshot)
+
+def _fail_unfinished(error: str):
+    global _downloads_json
+    _downloads_json = None
+    for download_id, record in downloads.items():
+        if download_id not in _finished_ids:
+            record["status"] = "error"
+            record["error"] = error
+            _finished_ids.add(download_id)
+            _publish(download_id)
+
+def _pump_progress(progress_queue, loop: asyncio.AbstractEventLoop, stop: threading.Event):
+    # Runs on its pool's pump thread until stopped and drained. Log records
+    # are handled right here; progress events go to the event loop.
+    while True:
+        try:
+            event = progress_queue.get(timeout=PUMP_POLL_INTERVAL)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if isinstance(event, logging.LogRecord):
+            logging.getLogger(event.name).handle(event)
+            continue
+        try:
+            loop.call_soon_threadsafe(_handle_event, event)
+        except RuntimeError:
+            # The event loop is closed; nobody is left to apply the event.
+            return
+
+def _handle_event(event: tuple):
+    download_id, d = event
+    if d['status'] == 'started':
+        _started_jobs.add((download_id, d.get('item')))
+        return
+    update_download(download_id, d)
+    # Each listed playlist entry is downloaded as a job of its own, so
+    # entries download while the rest of the playlist is still listed.
+    if d['status'] == 'entry' and d['url'] is not None and download_id in downloads:
+        record = downloads[download_id]
+        _start_job(download_id, {
+            "url": d['url'],
+            "ie_key": d['ie_key'],
+            "format": record['format'],
+            "quality": record['quality'],
+            "is_playlist": False,
+        }, item=len(record['items']) - 1)
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+    logger.handlers[:] = [QueueHandler(progress_queue)]
+
+def _report(download_id: str, event: dict):
+    if _active_item is not None:
+        event['item'] = _active_item
+    _progress_queue.put((download_id, event))
+
+def progress_hook(d):
+    # yt-dlp calls this for every chunk it receives; forward at most one
+    # 'downloading' event per PROGRESS_INTERVAL, plus the one reaching 100%.
+    global _last_progress_at
+    if d['status'] == 'downloading':
+        now = time.monotonic()
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if now - _last_progress_at < PROGRESS_INTERVAL and not (total and d.get('downloaded_bytes', 0) >= total):
+            return
+        _last_progress_at = now
+    # The full hook dict carries the whole info_dict; only forward what
+    # update_download reads.
+    _report(_active_download_id, {
+        key: d[key]
+        for key in ('status', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'filename', 'error')
+        if key in d
+    })
+
+def get_ydl(format: str, quality: str) -> yt_dlp.YoutubeDL:
+    """Return the shared YoutubeDL instance for a format/quality combination.
+    Parameters:
+        - format (str): The video/audio format (e.g., 'mp4', 'webm', 'm4a', 'mp3').
+        - quality (str): The desired quality level (e.g., 'high', 'medium', 'low').
+    Returns:
+        - yt_dlp.YoutubeDL: A long-lived instance, built on first use and reused afterwards.
+    Processing Logic:
+        - Options only depend on the arguments, so instances are cached in _ydl_cache and extractor setup is paid once per combination and worker.
+        - progress_hook reports to whichever download is in _active_download_id."""
+    key = (format, quality)
+    if key not in _ydl_cache:
+        ydl_opts = {
+            'format': get_format_string(format, quality),
+            'progress_hooks': [progress_hook],
+            'outtmpl': 'downloads/%(title)s.%(ext)s',
+            'quiet': True,
+            'no_warnings': True,
+            # yt-dlp sends its chatter to logger.debug, which INFO drops.
+            'logger': logging.getLogger("downloader.yt_dlp"),
+            'ignoreerrors': True,
+            # Fetch DASH/HLS fragments in parallel instead of one at a time.
+            'concurrent_fragment_downloads': 8,
+            # Merge separate video/audio streams straight into the target
+            # container instead of merging to mkv and converting afterwards.
+            'merge_output_format': format if format in ['mp4', 'webm'] else None,
+            'postprocessors': POSTPROC.get(format, _no_pp)(format, quality),
         }
-    }
-    return format_options[format][quality]
+        _ydl_cache[key] = yt_dlp.YoutubeDL(ydl_opts)
+    return _ydl_cache[key]
+
+def _cached_extract(ydl: yt_dlp.YoutubeDL, url: str, ie_key: str | None = None) -> dict | None:
+    """Extract the unprocessed info for a URL, reusing a recent extraction of the same URL.
+    Parameters:
+        - ydl (yt_dlp.YoutubeDL): The instance to extract with on a cache miss.
+        - url (str): The URL to extract.
+        - ie_key (str | None): The extractor to use, as given by a playlist entry whose 'url' may be a bare video ID.
+    Returns:
+        - dict | None: A private copy of the info dict, or None if extraction failed.
+    Processing Logic:
+        - Extracts with process=False so format selection is left to download time; the result therefore does not depend on format or quality.
+        - Follows plain 'url' redirects (e.g. a watch URL with a list= parameter) so a playlist is recognised as one.
+        - Leaves playlist entries as the lazy generator yt-dlp returns, so they can be consumed while later pages are still being fetched; the playlist is cached once it has been listed in full.
+        - Keeps at most MAX_CACHED_INFOS extractions, dropping the least recently used.
+        - Returns deep copies because processing the info for download mutates it."""
+    now = time.monotonic()
+    key = (url, ie_key)
+    cached = _info_cache.get(key)
+    if cached is not None and now - cached[0] < INFO_CACHE_TTL:
+        _info_cache.move_to_end(key)
+        return copy.deepcopy(cached[1])
+
+    info = ydl.extract_info(url, download=False, ie_key=ie_key, process=False)
+    while info is not None and info.get('_type') == 'url':
+        info = ydl.extract_info(info['url'], download=False, ie_key=info.get('ie_key'), process=False)
+    if info is None:
+        return None
+
+    if info.get('_type') in ('playlist', 'multi_video'):
+        info['entries'] = _cache_entries(key, now, info, info.get('entries') or [])
+        return info
+    _cache_info(key, now, info)
+    return copy.deepcopy(info)
+
+def _cache_entries(key: tuple, extracted_at: float, info: dict, entries):
+    listed = []
+    for entry in entries:
+        # The consumer may process (and so mutate) the entry it is handed
+        listed.append(copy.deepcopy(entry))
+        yield entry
+    _cache_info(key, extracted_at, {**info, 'entries': listed})
+
+def _cache_info(key: tuple, extracted_at: float, info: dict):
+    now = time.monotonic()
+    for expired in [expired for expired, (cached_at, _) in _info_cache.items() if now - cached_at >= INFO_CACHE_TTL]:
+        del _info_cache[expired]
+    _info_cache[key] = (extracted_at, info)
+    _info_cache.move_to_end(key)
+    while len(_info_cache) > MAX_CACHED_INFOS:
+        _info_cache.popitem(last=False)
+
+def _run_ydl(download_id: str, request: dict, item: int | None = None):
+    """Download the media described by a request inside a worker process.
+    Parameters:
+        - download_id (str): The ID of the download entry to report progress for.
+        - request (dict): The DownloadRequest fields (url, format, quality, is_playlist), plus the 'ie_key' of a playlist entry.
+        - item (int | None): Index of the playlist entry this request downloads, or None for a download of its own.
+    Processing Logic:
+        - Extracts the info once (or reuses a recent extraction) and rejects playlists that were not requested as such.
+        - Only lists a playlist, reporting each entry as soon as yt-dlp yields it; the event loop downloads every plain 'url' entry as a separate request, other entries are downloaded here.
+        - Downloads anything else from the already extracted info instead of resolving the URL a second time.
+        - Reports 'started' first, so the event loop knows the job reached a worker.
+        - Never raises; the outcome is reported as a 'done' or 'failed' event after all progress events."""
+    global _active_download_id, _active_item
+    _active_download_id = download_id
+    _active_item = item
+    _report(download_id, {"status": "started"})
+    ydl = get_ydl(request["format"], request["quality"])
+    try:
+        info = _cached_extract(ydl, request["url"], request.get("ie_key"))
+        if info is None:
+            raise ValueError("Could not extract media information from the URL.")
+
+        if info.get('_type') == 'playlist' and not request["is_playlist"]:
+            raise ValueError("URL is a playlist. Please check 'This is a playlist' to download.")
+
+        if request["is_playlist"] and info.get('_type') == 'playlist':
+            _report(download_id, {"status": "playlist", "title": info.get('title')})
+            listed = 0
+            for entry in info['entries']:
+                if not entry:
+                    continue
+                # Only a plain 'url' entry can be handed off as a URL; others
+                # are already resolved or carry url_transparent metadata.
+                url = entry.get('url') if entry.get('_type') == 'url' else None
+                _report(download_id, {
+                    "status": "entry",
+                    "title": entry.get('title') or 'Unknown',
+                    "url": url,
+                    "ie_key": entry.get('ie_key'),
+                })
+                if url is None:
+                    _download_entry(ydl, download_id, entry, listed)
+                listed += 1
+        else:
+            # Download from the info we already extracted; ydl.download would
+            # resolve the URL (and decipher signatures) a second time.
+            ydl.process_ie_result(info, download=True)
+        _report(download_id, {"status": "done"})
+    except Exception as e:
+        _report(download_id, {"status": "failed", "error": str(e)})
+
+def _download_entry(ydl: yt_dlp.YoutubeDL, download_id: str, entry: dict, item: int):
+    global _active_item
+    _active_item = item
+    try:
+        ydl.process_ie_result(entry, download=True)
+        _report(download_id, {"status": "done"})
+    except Exception as e:
+        _report(download_id, {"status": "failed", "error": str(e)})
+    finally:
+        _active_item = None
+
+def _replace_executor(broken: ProcessPoolExecutor):
+    # Every job a broken pool held, running or not, fails with
+    # BrokenProcessPool; only the first of them swaps in a new pool. The old
+    # pump stops once it has drained what the dead pool's workers sent.
+    if EXECUTOR is broken:
+        logger.error("A download worker died; restarting the worker pool")
+        _pump_stop.set()
+        broken.shutdown(wait=False)
+        _start_pool()
+
+async def _run_job(download_id: str, request: dict, item: int | None = None):
+    loop = asyncio.get_running_loop()
+    slots = _playlist_slots.get(download_id) if item is not None else None
+    job = (download_id, item)
+    try:
+        async with slots or nullcontext():
+            for attempt in range(2):
+                async with _worker_slots:
+                    executor = EXECUTOR
+                    try:
+                        await loop.run_in_executor(executor, _run_ydl, download_id, request, item)
+                        return
+                    except BrokenProcessPool:
+                        _replace_executor(executor)
+                        # A job that never reached a worker lost nothing;
+                        # give it one more go on the new pool.
+                        if job in _started_jobs or attempt:
+                            raise
+    except Exception as e:
+        # A worker died (e.g. killed by the OS) while running this job;
+        # _run_ydl reports every other failure through the progress queue.
+        event = {"status": "failed", "error": str(e)}
+        if item is not None:
+            event["item"] = item
+        update_download(download_id, event)
+    finally:
+        _started_jobs.discard(job)
+
+def _start_job(download_id: str, request: dict, item: int | None = None):
+    task = asyncio.create_task(_run_job(download_id, request, item))
+    _jobs.add(task)
+    task.add_done_callback(_jobs.discard)
 
 @app.post("/download")
 async def create_download(request: DownloadRequest):
@@ -78,16 +577,31 @@ async def create_download(request: DownloadRequest):
     Returns:
         - dict: A dictionary containing the download ID of the initiated download process.
     Processing Logic:
+        - Rejects format/quality pairs missing from FORMAT_OPTIONS, and playlist URLs not marked as playlists, with a 400 before anything is created.
         - Creates a 'downloads' directory if it doesn't exist.
-        - Initializes a download entry in the downloads dictionary, which tracks the download's status, progress, and associated metadata.
-        - Uses yt_dlp library to handle the download, integrating progress and error reporting through a custom progress hook.
-        - Handles special case for playlists, marking individual items' states and progressing through them.
+        - Returns the existing download ID when the same URL, format and quality was already downloaded or is in progress.
+        - Initializes a download entry under a random ID in the bounded downloads dictionary, which tracks the download's status, progress, and associated metadata.
+        - Hands the download to a worker process and returns immediately; progress arrives through update_download.
         - Catches and manages exceptions, updating the download status to 'error' and including error details."""
+    if (request.format, request.quality) not in FORMAT_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format/quality: {request.format}/{request.quality}")
+    # Catch the obvious cases before a worker is tied up extracting them;
+    # _run_ydl still rejects playlists this check misses.
+    if not request.is_playlist and _looks_like_playlist(request.url):
+        raise HTTPException(status_code=400, detail="URL is a playlist. Please check 'This is a playlist' to download.")
+
     try:
         # Create a downloads directory if it doesn't exist
         os.makedirs("downloads", exist_ok=True)
 
-        download_id = str(len(downloads) + 1)
+        # Reuse a finished or in-flight download of the same media instead
+        # of fetching and converting it again; failed ones are retried.
+        key = (request.url, request.format, request.quality, request.is_playlist)
+        existing_id = _download_ids.get(key)
+        if existing_id is not None and downloads[existing_id]["status"] != "error":
+            return {"id": existing_id}
+
+        download_id = uuid.uuid4().hex
         download_info = {
             "id": download_id,
             "url": request.url,
@@ -103,92 +617,24 @@ async def create_download(request: DownloadRequest):
             "items": []
         }
         downloads[download_id] = download_info
+        _download_ids[key] = download_id
+        global _downloads_json
+        _downloads_json = None
+        while len(downloads) > MAX_TRACKED_DOWNLOADS:
+            evicted_id, evicted = downloads.popitem(last=False)
+            _finished_ids.discard(evicted_id)
+            _listing_ids.discard(evicted_id)
+            _playlist_slots.pop(evicted_id, None)
+            # Its events are dropped from now on, so end any open stream
+            # with the last state it had.
+            for subscriber in _subscribers.pop(evicted_id, []):
+                subscriber.put_nowait((orjson.dumps(evicted), True))
+            evicted_key = (evicted["url"], evicted["format"], evicted["quality"], evicted["is_playlist"])
+            if _download_ids.get(evicted_key) == evicted["id"]:
+                del _download_ids[evicted_key]
 
-        def progress_hook(d):
-            if d['status'] == 'downloading':
-                try:
-                    if 'total_bytes' in d:
-                        progress = (d['downloaded_bytes'] / d['total_bytes']) * 100
-                    elif 'total_bytes_estimate' in d:
-                        progress = (d['downloaded_bytes'] / d['total_bytes_estimate']) * 100
-                    else:
-                        progress = 0
-
-                    downloads[download_id]['progress'] = progress
-                    downloads[download_id]['title'] = d.get('filename', '').replace('downloads/', '')
-                    downloads[download_id]['status'] = 'downloading'
-
-                    if downloads[download_id]['items']:
-                        downloads[download_id]['items'][-1]['progress'] = progress
-                        downloads[download_id]['items'][-1]['title'] = d.get('filename', '').replace('downloads/', '')
-                        downloads[download_id]['items'][-1]['status'] = 'downloading'
-
-                    downloads[download_id]["title"] = d.get('filename', '').replace('downloads/', '')
-                except Exception as e:
-                    print(f"Error updating progress: {e}")
-
-            elif d['status'] == 'finished':
-                if downloads[download_id]['items']:
-                    downloads[download_id]['items'][-1]['status'] = 'completed'
-                    downloads[download_id]['items'][-1]['progress'] = 100
-                downloads[download_id]['current_item'] += 1
-                downloads[download_id]['status'] = 'completed' if downloads[download_id]['current_item'] >= downloads[download_id]['total_items'] else 'downloading'
-                downloads[download_id]['progress'] = 100 if downloads[download_id]['status'] == 'completed' else downloads[download_id]['progress']
-            elif d['status'] == 'error':
-                if downloads[download_id]["items"]:
-                    downloads[download_id]["items"][-1]["status"] = "error"
-                    downloads[download_id]["items"][-1]["error"] = str(d.get('error', 'Unknown error'))
-                downloads[download_id]["error"] = str(d.get('error', 'Unknown error'))
-
-        ydl_opts = {
-            'format': get_format_string(request.format, request.quality),
-            'progress_hooks': [progress_hook],
-            'outtmpl': 'downloads/%(title)s.%(ext)s',
-            'quiet': True,
-            'no_warnings': True,
-            'ignoreerrors': True,
-            'extract_flat': request.is_playlist,
-            'postprocessors': [{
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': request.format,
-            }] if request.format in ['mp4', 'webm'] else [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': request.format,
-                'preferredquality': '192' if request.quality == 'high' else '128',
-            }] if request.format in ['mp3', 'm4a'] else []
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(request.url, download=False)
-
-                if info.get('_type') == 'playlist' and not request.is_playlist:
-                    raise HTTPException(status_code=400, detail="URL is a playlist. Please check 'This is a playlist' to download.")
-
-                if request.is_playlist and info.get('_type') == 'playlist':
-                    downloads[download_id]["total_items"] = len(info.get('entries', []))
-                    downloads[download_id]["items"] = [
-                        {
-                            "title": entry.get('title', 'Unknown'),
-                            "status": "pending",
-                            "progress": 0,
-                            "error": None
-                        }
-                        for entry in info.get('entries', [])
-                    ]
-
-                ydl.download([request.url])
-
-                if downloads[download_id]["error"] is None:
-                    if downloads[download_id]["current_item"] >= downloads[download_id]["total_items"]:
-                        downloads[download_id]["status"] = "completed"
-                        downloads[download_id]["progress"] = 100
-
-                return {"id": download_id}
-            except Exception as e:
-                downloads[download_id]["status"] = "error"
-                downloads[download_id]["error"] = str(e)
-                raise HTTPException(status_code=500, detail=str(e))
+        _start_job(download_id, request.model_dump())
+        return {"id": download_id}
 
     except Exception as e:
         if 'download_id' in locals():
@@ -197,10 +643,63 @@ async def create_download(request: DownloadRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/downloads")
-async def get_downloads():
-    return list(downloads.values())
+async def get_downloads(since: str | None = None):
+    """List the most recent downloads, oldest first.
+    Parameters:
+        - since (str | None): Optional download ID; only downloads created after it are returned.
+    Returns:
+        - Response: A JSON list of at most MAX_LISTED_DOWNLOADS download records.
+    Processing Logic:
+        - The full listing is serialized once and served from _downloads_json until a record changes."""
+    global _downloads_json
+    if since not in downloads:
+        if _downloads_json is None:
+            _downloads_json = orjson.dumps(list(downloads.values())[-MAX_LISTED_DOWNLOADS:])
+        return Response(content=_downloads_json, media_type="application/json")
+    records = list(downloads.values())[list(downloads).index(since) + 1:]
+    return Response(content=orjson.dumps(records[-MAX_LISTED_DOWNLOADS:]), media_type="application/json")
+
+@app.get("/downloads/{download_id}/events")
+async def get_download_events(download_id: str):
+    """Stream a download's record as Server-Sent Events whenever it changes.
+    Parameters:
+        - download_id (str): The ID of the download to follow.
+    Returns:
+        - StreamingResponse: A text/event-stream with one JSON record per event.
+    Processing Logic:
+        - Sends the current record first, then every update pushed by update_download, and a keep-alive comment after KEEPALIVE_INTERVAL quiet seconds.
+        - Ends the stream once the worker has reported the download as done or failed."""
+    if download_id not in downloads:
+        raise HTTPException(status_code=404, detail="Download not found")
+
+    updates = asyncio.Queue()
+    _subscribers.setdefault(download_id, []).append(updates)
+    updates.put_nowait((orjson.dumps(downloads[download_id]), download_id in _finished_ids))
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    snapshot, is_final = await asyncio.wait_for(updates.get(), KEEPALIVE_INTERVAL)
+                except TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield b"data: " + snapshot + b"\n\n"
+                if is_final:
+                    return
+        finally:
+            # Already gone if the download was evicted
+            subscribers = _subscribers.get(download_id)
+            if subscribers is not None:
+                subscribers.remove(updates)
+                if not subscribers:
+                    del _subscribers[download_id]
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 if __name__ == "__main__":
     print("Starting FastAPI server...")
-    uvicorn.run(app, host="127.0.0.1", port=5001, log_level="info")
\ No newline at end of file
+    # Open event streams only end with their download; don't let them hold
+    # up shutdown.
+    uvicorn.run(app, host="127.0.0.1", port=5001, log_level="info", loop="uvloop", http="httptools", timeout_graceful_shutdown=5)
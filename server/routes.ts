@@ -5,6 +5,8 @@ import path from "path";
 import { fileURLToPath } from "url";
 
 const clients = new Set<any>();
+// Download ids whose event stream from the Python service is being followed
+const followedDownloads = new Set<string>();
 let pythonProcess: any = null;
 
 export function registerRoutes(app: Express): Server {
@@ -67,12 +69,52 @@ export function registerRoutes(app: Express): Server {
     req.on("close", () => clients.delete(res));
   });
 
-  function notifyClients() {
+  // Sends a download record as JSON when one changed, or a bare "update"
+  // when clients should refetch the whole list.
+  function notifyClients(record?: string) {
     clients.forEach(client => {
-      client.write(`data: update\n\n`);
+      client.write(`data: ${record ?? "update"}\n\n`);
     });
   }
 
+  // POST /download returns as soon as the download is queued, so follow its
+  // event stream and pass every updated record on until it finishes.
+  async function followDownload(id: string) {
+    if (followedDownloads.has(id)) {
+      return;
+    }
+    followedDownloads.add(id);
+    try {
+      const response = await fetch(`http://localhost:5001/downloads/${id}/events`);
+      if (!response.ok || !response.body) {
+        throw new Error(await response.text());
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+          break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let end;
+        while ((end = buffer.indexOf("\n\n")) !== -1) {
+          const event = buffer.slice(0, end);
+          buffer = buffer.slice(end + 2);
+          if (event.startsWith("data: ")) {
+            notifyClients(event.slice("data: ".length));
+          }
+        }
+      }
+    } catch (error) {
+      console.error(`Failed to follow download ${id}:`, error);
+    } finally {
+      followedDownloads.delete(id);
+      notifyClients();
+    }
+  }
+
   waitForPythonService.then(() => {
     console.log("Python service is ready");
 
@@ -103,6 +145,7 @@ export function registerRoutes(app: Express): Server {
 
         const result = await response.json();
         notifyClients();
+        followDownload(result.id);
         res.json(result);
       } catch (error) {
         console.error(error);
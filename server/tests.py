@@ -1,123 +1,359 @@
 import unittest
-import aiohttp
 import asyncio
+import json
 import os
-import time
-import subprocess
-from typing import Optional, Tuple
+import queue
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from unittest.mock import patch
+from httpx import AsyncClient, ASGITransport, HTTPError
+
+if __name__ == "__main__":
+    # Run as `python server/tests.py`: make the repository root importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from server import downloader
+from server.downloader import app
 
 # Using a shorter video for testing
 TEST_VIDEO_URL = "https://www.youtube.com/watch?v=jNQXAC9IVRw"  # "Me at the zoo" - First YouTube video
-API_BASE_URL = "http://localhost:5001"
+DOWNLOADS_DIR = "downloads"
+MEDIA_SUFFIXES = {".mp4", ".webm", ".mp3", ".m4a"}
 
-class YouTubeDownloaderTests(unittest.TestCase):
+class YouTubeDownloaderTests(unittest.IsolatedAsyncioTestCase):
     @classmethod
     def setUpClass(cls):
-        """Start the FastAPI server before running tests"""
-        print("Starting FastAPI server...")
-        cls.server_process = subprocess.Popen(
-            ["python3", "server/downloader.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        # Wait for server to start
-        time.sleep(5)
-        print("Server started")
+        """Remove media left behind by an interrupted run"""
+        if not os.path.isdir(DOWNLOADS_DIR):
+            return
+        with os.scandir(DOWNLOADS_DIR) as entries:
+            for entry in entries:
+                if entry.is_file() and os.path.splitext(entry.name)[1] in MEDIA_SUFFIXES:
+                    try:
+                        os.unlink(entry.path)
+                        print(f"Cleaned up: {entry.name}")
+                    except Exception as e:
+                        print(f"Failed to clean up {entry.name}: {e}")
 
-    @classmethod
-    def tearDownClass(cls):
-        """Shutdown the server after tests"""
-        print("Shutting down server...")
-        if hasattr(cls, 'server_process'):
-            cls.server_process.terminate()
-            cls.server_process.wait()
-        print("Server stopped")
+    async def asyncSetUp(self):
+        """Run the app's lifespan (worker pool, progress pump) and call it in-process"""
+        self.lifespan = app.router.lifespan_context(app)
+        await self.lifespan.__aenter__()
+        self.client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        await self.lifespan.__aexit__(None, None, None)
 
     async def download_and_verify(self, format: str, quality: str) -> Optional[str]:
         """Helper function to start a download and verify its completion"""
         print(f"\nTesting download with format={format}, quality={quality}")
-        async with aiohttp.ClientSession() as session:
-            # Start download
-            payload = {
-                "url": TEST_VIDEO_URL,
-                "format": format,
-                "quality": quality,
-                "is_playlist": False
-            }
-
-            try:
-                async with session.post(f"{API_BASE_URL}/download", json=payload, timeout=30) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        self.fail(f"Failed to start download: {error_text}")
-
-                    data = await response.json()
-                    download_id = data["id"]
-                    print(f"Download started with ID: {download_id}")
-
-                    # Poll download status
-                    max_attempts = 30  # 2.5 minutes timeout (30 * 5 seconds)
-                    attempt = 0
-                    while attempt < max_attempts:
-                        async with session.get(f"{API_BASE_URL}/downloads", timeout=10) as status_response:
-                            downloads = await status_response.json()
-                            download = next((d for d in downloads if d["id"] == download_id), None)
-
-                            if not download:
-                                self.fail(f"Download {download_id} not found")
+        # Start download
+        payload = {
+            "url": TEST_VIDEO_URL,
+            "format": format,
+            "quality": quality,
+            "is_playlist": False
+        }
 
-                            print(f"Download status: {download['status']}, progress: {download.get('progress', 0)}%")
+        try:
+            response = await self.client.post("/download", json=payload)
+            if response.status_code != 200:
+                self.fail(f"Failed to start download: {response.text}")
 
-                            if download["status"] == "completed":
-                                return download["title"]
-                            elif download["status"] == "error":
-                                self.fail(f"Download failed: {download.get('error', 'Unknown error')}")
+            download_id = response.json()["id"]
+            print(f"Download started with ID: {download_id}")
 
-                            await asyncio.sleep(5)
-                            attempt += 1
+            # Follow the download's event stream until the server closes it
+            download = None
+            async with asyncio.timeout(150):  # 2.5 minutes
+                async with self.client.stream("GET", f"/downloads/{download_id}/events") as events:
+                    if events.status_code != 200:
+                        self.fail(f"Download {download_id} not found")
 
-                    self.fail("Download timeout")
-                    return None
-            except aiohttp.ClientError as e:
-                self.fail(f"Connection error: {str(e)}")
-            except asyncio.TimeoutError:
-                self.fail("Operation timed out")
-            except Exception as e:
-                self.fail(f"Unexpected error: {str(e)}")
+                    async for line in events.aiter_lines():
+                        if line.startswith("data: "):
+                            download = json.loads(line[len("data: "):])
+                            print(f"Download status: {download['status']}, progress: {download.get('progress', 0)}%")
 
-    def setUp(self):
-        """Set up each test"""
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
-        # Clean up any existing downloads
-        for file in os.listdir("."):
-            if file.endswith((".mp4", ".webm", ".mp3", ".m4a")):
-                try:
-                    os.remove(file)
-                    print(f"Cleaned up: {file}")
-                except Exception as e:
-                    print(f"Failed to clean up {file}: {e}")
-
-    def tearDown(self):
-        """Clean up after each test"""
-        self.loop.close()
-
-    def test_mp4_download_high_quality(self):
+            if download is None:
+                self.fail(f"No events received for download {download_id}")
+            if download["status"] == "error":
+                self.fail(f"Download failed: {download.get('error', 'Unknown error')}")
+            if download["status"] != "completed":
+                self.fail(f"Download ended with status {download['status']}")
+            return download["title"]
+        except HTTPError as e:
+            self.fail(f"Connection error: {str(e)}")
+        except TimeoutError:
+            self.fail("Operation timed out")
+        except Exception as e:
+            self.fail(f"Unexpected error: {str(e)}")
+
+    async def test_mp4_download_high_quality(self):
         """Test downloading video in MP4 format with high quality"""
-        output_file = self.loop.run_until_complete(
-            self.download_and_verify("mp4", "high")
-        )
-        self.assertTrue(any(f.endswith(".mp4") for f in os.listdir(".")))
+        output_file = await self.download_and_verify("mp4", "high")
+        self.assertTrue(any(f.endswith(".mp4") for f in os.listdir(DOWNLOADS_DIR)))
         print(f"✅ Successfully downloaded MP4 (High Quality): {output_file}")
 
-    def test_mp3_extraction(self):
+    async def test_mp3_extraction(self):
         """Test extracting audio in MP3 format"""
-        output_file = self.loop.run_until_complete(
-            self.download_and_verify("mp3", "high")
-        )
-        self.assertTrue(any(f.endswith(".mp3") for f in os.listdir(".")))
+        output_file = await self.download_and_verify("mp3", "high")
+        self.assertTrue(any(f.endswith(".mp3") for f in os.listdir(DOWNLOADS_DIR)))
         print(f"✅ Successfully extracted MP3: {output_file}")
 
+def reset_downloads():
+    """Forget every download record and the bookkeeping kept alongside it"""
+    downloader.downloads.clear()
+    downloader._download_ids.clear()
+    downloader._finished_ids.clear()
+    downloader._listing_ids.clear()
+    downloader._playlist_slots.clear()
+    downloader._subscribers.clear()
+    downloader._started_jobs.clear()
+    downloader._downloads_json = None
+
+def add_download(download_id: str, is_playlist: bool) -> dict:
+    """Insert a fresh record the way create_download does"""
+    record = {
+        "id": download_id,
+        "url": f"https://example.com/{download_id}",
+        "format": "mp4",
+        "quality": "high",
+        "progress": 0,
+        "status": "downloading",
+        "title": "",
+        "is_playlist": is_playlist,
+        "error": None,
+        "current_item": 0,
+        "total_items": 0,
+        "items": []
+    }
+    downloader.downloads[download_id] = record
+    return record
+
+class DownloadStateTests(unittest.IsolatedAsyncioTestCase):
+    """Drive update_download and the progress pump with synthetic worker events"""
+
+    def setUp(self):
+        reset_downloads()
+
+    def list_playlist(self, download_id: str, titles: list):
+        downloader.update_download(download_id, {"status": "playlist", "title": "Playlist"})
+        for title in titles:
+            downloader.update_download(download_id, {"status": "entry", "title": title, "url": f"https://example.com/{title}", "ie_key": None})
+
+    def test_playlist_completes_once_listed_and_settled(self):
+        """A playlist finishes only after its listing is done and every item has settled"""
+        record = add_download("pl", is_playlist=True)
+        self.list_playlist("pl", ["a", "b"])
+        self.assertEqual(record["total_items"], 2)
+        self.assertEqual([item["status"] for item in record["items"]], ["pending", "pending"])
+        self.assertIn("pl", downloader._playlist_slots)
+
+        downloader.update_download("pl", {"status": "done", "item": 0})
+        downloader.update_download("pl", {"status": "done", "item": 1})
+        self.assertEqual(record["status"], "downloading")
+        self.assertNotIn("pl", downloader._finished_ids)
+
+        downloader.update_download("pl", {"status": "done"})
+        self.assertEqual(record["status"], "completed")
+        self.assertEqual(record["progress"], 100)
+        self.assertEqual(record["current_item"], 2)
+        self.assertIn("pl", downloader._finished_ids)
+        self.assertNotIn("pl", downloader._playlist_slots)
+
+    def test_listed_playlist_waits_for_items(self):
+        """Finishing the listing first leaves the playlist running until its items settle"""
+        record = add_download("pl", is_playlist=True)
+        self.list_playlist("pl", ["a"])
+        downloader.update_download("pl", {"status": "done"})
+        self.assertEqual(record["status"], "downloading")
+
+        downloader.update_download("pl", {"status": "done", "item": 0})
+        self.assertEqual(record["status"], "completed")
+
+    def test_item_progress_updates_item_and_average(self):
+        """Progress of one entry updates that item and averages into the playlist"""
+        record = add_download("pl", is_playlist=True)
+        self.list_playlist("pl", ["a", "b"])
+        downloader.update_download("pl", {
+            "status": "downloading", "item": 1, "downloaded_bytes": 50, "total_bytes": 100, "filename": "downloads/b.mp4"
+        })
+        self.assertEqual(record["items"][0]["status"], "pending")
+        self.assertEqual(record["items"][1]["status"], "downloading")
+        self.assertEqual(record["items"][1]["progress"], 50)
+        self.assertEqual(record["items"][1]["title"], "b.mp4")
+        self.assertEqual(record["progress"], 25)
+        self.assertEqual(record["title"], "Playlist")
+
+    def test_item_finished_events_do_not_count(self):
+        """'finished' fires once per merged stream, so only 'done' settles an item"""
+        record = add_download("pl", is_playlist=True)
+        self.list_playlist("pl", ["a"])
+        downloader.update_download("pl", {"status": "finished", "item": 0})
+        downloader.update_download("pl", {"status": "finished", "item": 0})
+        self.assertEqual(record["current_item"], 0)
+        self.assertEqual(record["items"][0]["status"], "pending")
+
+    def test_failed_item_fails_playlist(self):
+        """A failed entry is reported on its item and leaves the playlist in error"""
+        record = add_download("pl", is_playlist=True)
+        self.list_playlist("pl", ["a", "b"])
+        downloader.update_download("pl", {"status": "failed", "item": 0, "error": "boom"})
+        downloader.update_download("pl", {"status": "done", "item": 1})
+        downloader.update_download("pl", {"status": "done"})
+        self.assertEqual(record["items"][0]["status"], "error")
+        self.assertEqual(record["items"][0]["error"], "boom")
+        self.assertEqual(record["items"][1]["status"], "completed")
+        self.assertEqual(record["status"], "error")
+        self.assertEqual(record["error"], "boom")
+        self.assertIn("pl", downloader._finished_ids)
+
+    def test_failed_single_download(self):
+        """A failed single download is finished with its error"""
+        record = add_download("one", is_playlist=False)
+        downloader.update_download("one", {"status": "failed", "error": "boom"})
+        self.assertEqual(record["status"], "error")
+        self.assertEqual(record["error"], "boom")
+        self.assertIn("one", downloader._finished_ids)
+
+    def test_events_for_evicted_download_are_dropped(self):
+        """Events arriving after a record was evicted are ignored"""
+        downloader.update_download("gone", {"status": "done"})
+        self.assertNotIn("gone", downloader.downloads)
+        self.assertNotIn("gone", downloader._finished_ids)
+
+    def test_subscribers_receive_final_snapshot(self):
+        """Open event streams get every update, the last one marked final"""
+        add_download("one", is_playlist=False)
+        subscriber = asyncio.Queue()
+        downloader._subscribers["one"] = [subscriber]
+        downloader.update_download("one", {"status": "downloading", "downloaded_bytes": 1, "total_bytes": 2})
+        downloader.update_download("one", {"status": "done"})
+        snapshots = [subscriber.get_nowait() for _ in range(subscriber.qsize())]
+        self.assertEqual([is_final for _, is_final in snapshots], [False, True])
+        self.assertEqual(json.loads(snapshots[-1][0])["status"], "completed")
+
+    async def test_pump_starts_a_job_per_listed_entry(self):
+        """Entries with a URL become jobs of their own; resolved ones stay with the listing worker"""
+        add_download("pl", is_playlist=True)
+        events = queue.Queue()
+        events.put(("pl", {"status": "playlist", "title": "Playlist"}))
+        events.put(("pl", {"status": "entry", "title": "a", "url": "abc", "ie_key": "Youtube"}))
+        events.put(("pl", {"status": "entry", "title": "b", "url": None, "ie_key": None}))
+        events.put(("pl", {"status": "entry", "title": "c", "url": "https://example.com/c", "ie_key": None}))
+        # Already asked to stop: the pump still drains the queue first
+        stop = threading.Event()
+        stop.set()
+        pump = threading.Thread(target=downloader._pump_progress, args=(events, asyncio.get_running_loop(), stop))
+        with patch.object(downloader, "_start_job") as start_job:
+            pump.start()
+            await asyncio.to_thread(pump.join)
+            await asyncio.sleep(0)
+
+        self.assertEqual(downloader.downloads["pl"]["total_items"], 3)
+        self.assertEqual([call.args + (call.kwargs["item"],) for call in start_job.call_args_list], [
+            ("pl", {"url": "abc", "ie_key": "Youtube", "format": "mp4", "quality": "high", "is_playlist": False}, 0),
+            ("pl", {"url": "https://example.com/c", "ie_key": None, "format": "mp4", "quality": "high", "is_playlist": False}, 2),
+        ])
+
+class BrokenPool:
+    """Stands in for a ProcessPoolExecutor one of whose workers has died"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("A child process terminated abruptly"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+class WorkerPoolTests(unittest.IsolatedAsyncioTestCase):
+    """Check how a job reacts to its worker pool breaking"""
+
+    async def asyncSetUp(self):
+        reset_downloads()
+        self.record = add_download("one", is_playlist=False)
+        self.new_pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.new_pool.shutdown)
+        patch.object(downloader, "EXECUTOR", BrokenPool()).start()
+        patch.object(downloader, "_worker_slots", asyncio.Semaphore(downloader.MAX_CONCURRENT_DOWNLOADS)).start()
+        patch.object(downloader, "_pump_stop", threading.Event()).start()
+        patch.object(downloader, "_start_pool", side_effect=lambda: setattr(downloader, "EXECUTOR", self.new_pool)).start()
+        self.run_ydl = patch.object(downloader, "_run_ydl").start()
+        self.addCleanup(patch.stopall)
+
+    async def test_job_that_never_started_is_resubmitted(self):
+        """A job lost with the pool before reaching a worker runs on the replacement pool"""
+        await downloader._run_job("one", {"url": "https://example.com/one"})
+        self.run_ydl.assert_called_once_with("one", {"url": "https://example.com/one"}, None)
+        self.assertIs(downloader.EXECUTOR, self.new_pool)
+        self.assertEqual(self.record["status"], "downloading")
+
+    async def test_started_job_fails_with_the_pool(self):
+        """A job whose worker had already started it is reported as failed"""
+        downloader._started_jobs.add(("one", None))
+        await downloader._run_job("one", {"url": "https://example.com/one"})
+        self.run_ydl.assert_not_called()
+        self.assertIs(downloader.EXECUTOR, self.new_pool)
+        self.assertEqual(self.record["status"], "error")
+        self.assertNotIn(("one", None), downloader._started_jobs)
+
+class DownloadApiTests(unittest.IsolatedAsyncioTestCase):
+    """Check the request handling of the API in-process, without starting any download"""
+
+    async def asyncSetUp(self):
+        reset_downloads()
+        self.start_job = patch.object(downloader, "_start_job").start()
+        self.addCleanup(patch.stopall)
+        self.client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        # create_download makes the directory even though nothing is downloaded
+        if os.path.isdir(DOWNLOADS_DIR) and not os.listdir(DOWNLOADS_DIR):
+            os.rmdir(DOWNLOADS_DIR)
+
+    async def start(self, url: str, **overrides):
+        payload = {"url": url, "format": "mp4", "quality": "high", "is_playlist": False, **overrides}
+        return await self.client.post("/download", json=payload)
+
+    async def test_same_request_reuses_download(self):
+        """Repeating a request returns the existing download unless it failed"""
+        first = (await self.start("https://example.com/a")).json()["id"]
+        self.assertEqual((await self.start("https://example.com/a")).json()["id"], first)
+        self.assertNotEqual((await self.start("https://example.com/a", format="webm")).json()["id"], first)
+        self.assertEqual(self.start_job.call_count, 2)
+
+        downloader.downloads[first]["status"] = "error"
+        retried = (await self.start("https://example.com/a")).json()["id"]
+        self.assertNotEqual(retried, first)
+
+    async def test_list_since(self):
+        """?since= only lists downloads created after the given one"""
+        ids = [(await self.start(f"https://example.com/{name}")).json()["id"] for name in "abc"]
+        response = await self.client.get("/downloads", params={"since": ids[0]})
+        self.assertEqual([record["id"] for record in response.json()], ids[1:])
+        response = await self.client.get("/downloads")
+        self.assertEqual([record["id"] for record in response.json()], ids)
+
+    async def test_unknown_format_quality_rejected(self):
+        """A format/quality pair missing from FORMAT_OPTIONS is a 400"""
+        response = await self.start("https://example.com/a", format="flac")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(downloader.downloads), 0)
+
+    async def test_unflagged_playlist_url_rejected(self):
+        """An obvious playlist URL without the playlist flag is a 400"""
+        response = await self.start("https://www.youtube.com/watch?v=x&list=PL1")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(downloader.downloads), 0)
+        response = await self.start("https://www.youtube.com/playlist?list=PL1", is_playlist=True)
+        self.assertEqual(response.status_code, 200)
+
 if __name__ == "__main__":
     # Run the tests
-    unittest.main(verbosity=2)
\ No newline at end of file
+    unittest.main(verbosity=2)